@@ -1,7 +1,9 @@
+import os
 import streamlit as st
 import pandas as pd
-import altair as alt
 import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 # --- Page Config ---
 st.set_page_config(
@@ -21,75 +23,211 @@ with col2:
 
 st.markdown("---")
 
-import os
-
 # --- Load Data ---
-@st.cache_data
-def load_data():
-    file_path = 'urw_dashboard_data.csv'
-    malls_path = 'dim_malls_v1.csv'
+DATA_FILE = 'urw_dashboard_data.parquet'
+MALLS_FILE = 'dim_malls_v1.parquet'
+
+# Only the columns rendered by the dashboard are decoded from the Parquet file
+DASHBOARD_COLUMNS = [
+    'Store_Code', 'Current_SubCat', 'Rec_SubCat', 'Current_Sales_Density',
+    'Rec_Projected_Sales', 'Revenue_Uplift', 'Model_Location_Potential', 'Rec_Category',
+    'Rec_2_SubCat', 'Rec_2_Uplift', 'Rec_3_SubCat', 'Rec_3_Uplift', 'Mall_ID'
+]
 
+# Compact dtypes (the Parquet export already writes these; older files are cast on load)
+FLOAT_COLUMNS = [
+    'Revenue_Uplift', 'Current_Sales_Density', 'Rec_Projected_Sales',
+    'Model_Location_Potential', 'Rec_2_Uplift', 'Rec_3_Uplift'
+]
+CATEGORY_COLUMNS = ['Current_SubCat', 'Rec_SubCat', 'Rec_Category', 'Store_Code', 'Rec_2_SubCat', 'Rec_3_SubCat']
+
+# Alternative recommendations, missing from older exports
+ALTERNATIVE_COLUMNS = ['Rec_2_SubCat', 'Rec_2_Uplift', 'Rec_3_SubCat', 'Rec_3_Uplift']
+
+# Opportunities table
+TABLE_LABEL_COLUMNS = ['Store_Code', 'Current_SubCat', 'Rec_SubCat']
+TABLE_AMOUNT_COLUMNS = ['Current_Sales_Density', 'Rec_Projected_Sales', 'Revenue_Uplift']
+
+def resolve_path(file_name):
     # Safe path resolution
-    if not os.path.exists(file_path):
+    if not os.path.exists(file_name):
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(script_dir, 'urw_dashboard_data.csv')
-        malls_path = os.path.join(script_dir, 'dim_malls_v1.csv')
+        return os.path.join(script_dir, file_name)
+    return file_name
+
+def dashboard_columns(file_path):
+    available = set(pq.read_schema(file_path).names)
+    return [c for c in DASHBOARD_COLUMNS if c in available]
+
+def is_mall_ranked(df):
+    # Single linear pass: ascending Mall_ID, descending Revenue_Uplift within each mall,
+    # missing uplifts last (the order sort_values produces)
+    mall_ids = df['Mall_ID'].to_numpy()
+    uplift = df['Revenue_Uplift'].to_numpy()
+    mall_step = np.diff(mall_ids)
+    in_order = (uplift[1:] <= uplift[:-1]) | np.isnan(uplift[1:])
+    return bool(np.all((mall_step > 0) | ((mall_step == 0) & in_order)))
+
+def vectorize_label(df, col, template, fallback_col):
+    # Per-row labels without a per-row Python callback (no apply(axis=1)): `col` where
+    # present, else template + fallback_col. The fallback strings are built once per
+    # distinct value (the string pool) and broadcast back through the category codes.
+    # fallback_col must hold integers (a float column would give 'Mall 1.0'); rows
+    # missing both values (category code -1) stay missing.
+    fallback = df[fallback_col].astype('category')
+    pool = np.asarray(template + fallback.cat.categories.astype(str), dtype=object)
+    codes = fallback.cat.codes.to_numpy()
+    fallback_labels = np.where(codes >= 0, pool[codes], np.nan)
+    return pd.Categorical(np.where(df[col].notna(), df[col], fallback_labels))
+
+def format_euros(values, sign=''):
+    # '+€1,234' labels (with sign='+') for a whole column in one vectorized pass.
+    # Missing values get 'n/a' without the sign, so no bare '+' reaches the page.
+    labels = values.round().map('{:,.0f}'.format, na_action='ignore').astype('string')
+    return (sign + '€' + labels).fillna('n/a')
+
+# The cached loaders below take file modification times as arguments: the mtime is
+# the cache key, so a re-exported file invalidates the cached frames.
+
+# The mall names are tiny and identical for every session: cached once per process
+@st.cache_resource
+def load_malls_resource(malls_mtime):
+    if malls_mtime is None:
+        return {}
     
-    df = pd.read_csv(file_path)
+    malls = pd.read_parquet(resolve_path(MALLS_FILE), columns=['id', 'mall_name'])
+    return dict(zip(malls['id'].astype(int), malls['mall_name']))
+
+# One shared, read-only frame per file version: cache_resource hands out the cached
+# object itself, so the per-mall views below all point into the same arrays.
+# Callers must not assign into it (derived frames use .assign / new frames).
+@st.cache_resource(max_entries=2)
+def load_facts(facts_mtime):
+    file_path = resolve_path(DATA_FILE)
+    df = pd.read_parquet(file_path, columns=dashboard_columns(file_path))
     
-    # Merge Mall Names
-    if os.path.exists(malls_path):
-        try:
-             # Try reading with fallback encoding for special chars
-             try:
-                 malls = pd.read_csv(malls_path, encoding='utf-8')
-             except:
-                 malls = pd.read_csv(malls_path, encoding='latin1')
-             
-             malls['id'] = pd.to_numeric(malls['id'], errors='coerce')
-             df = df.merge(malls[['id', 'mall_name']], left_on='Mall_ID', right_on='id', how='left')
-             
-             df['Mall_Display'] = df.apply(
-                 lambda x: x['mall_name'] if pd.notna(x['mall_name']) else f"Mall {int(x['Mall_ID'])}",
-                 axis=1
-             )
-        except:
-             df['Mall_Display'] = "Mall " + df['Mall_ID'].astype(str)
-    else:
-        df['Mall_Display'] = "Mall " + df['Mall_ID'].astype(str)
-        
+    # Added as empty columns when absent, so every store row has the same keys
+    for c in ALTERNATIVE_COLUMNS:
+        if c not in df:
+            df[c] = np.nan
+    
+    df['Mall_ID'] = df['Mall_ID'].astype('int32')
+    for c in FLOAT_COLUMNS:
+        df[c] = pd.to_numeric(df[c], downcast='float')
+    for c in CATEGORY_COLUMNS:
+        df[c] = df[c].astype('category')
+    
+    # Sorted by mall so that every mall is one contiguous block of rows, ranked by
+    # uplift within the block: the top N opportunities are the block's first N rows.
+    # The Parquet export already writes rows in this order, so the sort is usually skipped.
+    if not is_mall_ranked(df):
+        df = df.sort_values(['Mall_ID', 'Revenue_Uplift'], ascending=[True, False], kind='stable').reset_index(drop=True)
     return df
 
+@st.cache_data
+def load_mall_bounds(facts_mtime):
+    # Binary search over the sorted Mall_ID column: {mall_id: (first_row, end_row)}
+    mall_ids = load_facts(facts_mtime)['Mall_ID'].to_numpy()
+    unique_ids = np.unique(mall_ids)
+    mall_starts = np.searchsorted(mall_ids, unique_ids, side='left')
+    mall_ends = np.searchsorted(mall_ids, unique_ids, side='right')
+    return {int(m): (int(lo), int(hi)) for m, lo, hi in zip(unique_ids, mall_starts, mall_ends)}
+
+@st.cache_resource(max_entries=2)
+def load_uplift_cumsums(facts_mtime):
+    # Rows are in descending uplift order within each mall, so the prefix sums give the
+    # top-N uplift total for any N: {mall_id: (cumsum array, non-missing count array)}.
+    # Missing uplifts are skipped, like Series.sum() / .mean(). Read-only arrays.
+    uplift = load_facts(facts_mtime)['Revenue_Uplift'].to_numpy()
+    return {
+        m: (np.nancumsum(uplift[lo:hi], dtype=np.float64), np.cumsum(~np.isnan(uplift[lo:hi])))
+        for m, (lo, hi) in load_mall_bounds(facts_mtime).items()
+    }
+
+@st.cache_data
+def load_mall_options(facts_mtime, malls_mtime):
+    # Sidebar options {Mall_Display: Mall_ID}, sorted by label. Built on one row per mall,
+    # so a rerun unpickles this small dict instead of the facts frame.
+    malls = pd.DataFrame({'Mall_ID': list(load_mall_bounds(facts_mtime))})
+    
+    # Mall names, falling back to "Mall <id>" for malls missing from the dim table
+    malls['mall_name'] = malls['Mall_ID'].map(load_malls_resource(malls_mtime))
+    malls['Mall_Display'] = vectorize_label(malls, 'mall_name', "Mall ", 'Mall_ID')
+    malls = malls.sort_values('Mall_Display')
+    return dict(zip(malls['Mall_Display'], malls['Mall_ID']))
+
+def file_mtime(file_name):
+    return os.path.getmtime(resolve_path(file_name))
+
+def load_mall_map(facts_mtime):
+    # Sidebar {Mall_Display: Mall_ID}; on a cold start this is what loads the facts file
+    malls_path = resolve_path(MALLS_FILE)
+    malls_mtime = os.path.getmtime(malls_path) if os.path.exists(malls_path) else None
+    return load_mall_options(facts_mtime, malls_mtime)
+
+# A view into the shared facts frame (no copy, and no unpickling as with cache_data).
+# The slice is read-only: nothing below assigns into mall_data.
+@st.cache_resource(max_entries=256)
+def get_mall_slice(mall_id, top_n, facts_mtime):
+    lo, hi = load_mall_bounds(facts_mtime)[mall_id]
+    return load_facts(facts_mtime).iloc[lo:min(hi, lo + top_n)]
+
+@st.cache_resource(max_entries=256)
+def get_mall_table(mall_id, top_n, facts_mtime):
+    # Smallest payload for st.dataframe: only the displayed columns, whole euros as
+    # int32, and category dictionaries trimmed to the stores in this slice.
+    # Returned as an Arrow table, so reruns skip the pandas -> Arrow conversion.
+    table = get_mall_slice(mall_id, top_n, facts_mtime)[TABLE_LABEL_COLUMNS + TABLE_AMOUNT_COLUMNS]
+    table = table.assign(
+        **{c: table[c].cat.remove_unused_categories() for c in TABLE_LABEL_COLUMNS},
+        **{c: table[c].round().astype('Int32') for c in TABLE_AMOUNT_COLUMNS}
+    )
+    return pa.Table.from_pandas(table, preserve_index=False)
+
+@st.cache_resource(max_entries=256)
+def get_store_rows(mall_id, top_n, facts_mtime):
+    # {Store_Code: row dict}: the simulator looks a store up by key instead of
+    # filtering the slice and building a Series on every widget change.
+    # Shared and read-only, so reruns do not unpickle the whole dict.
+    mall_data = get_mall_slice(mall_id, top_n, facts_mtime).drop_duplicates('Store_Code')
+    mall_data = mall_data.assign(
+        Revenue_Uplift_fmt=format_euros(mall_data['Revenue_Uplift'], sign='+'),
+        Rec_2_Uplift_fmt=format_euros(mall_data['Rec_2_Uplift'], sign='+'),
+        Rec_3_Uplift_fmt=format_euros(mall_data['Rec_3_Uplift'], sign='+')
+    )
+    return mall_data.set_index('Store_Code', drop=False).to_dict(orient='index')
+
+# The header above is already on screen while the data loads on a cold start
 try:
-    df = load_data()
+    facts_mtime = file_mtime(DATA_FILE)
+    with st.spinner("Loading data…"):
+        mall_map = load_mall_map(facts_mtime)
 except FileNotFoundError:
-    st.error("Data file `urw_dashboard_data.csv` not found. Please run the `Model.ipynb` final section first.")
+    st.error("Data file `urw_dashboard_data.parquet` not found. Please run the `Model.ipynb` final section first.")
     st.stop()
 
 # --- Sidebar Filters ---
 st.sidebar.header("📍 Location Filter")
 
-# Create Mapping
-mall_options = df[['Mall_ID', 'Mall_Display']].drop_duplicates().sort_values('Mall_Display')
-mall_map = dict(zip(mall_options['Mall_Display'], mall_options['Mall_ID']))
-
-selected_mall_name = st.sidebar.selectbox("Select Shopping Centre", mall_options['Mall_Display'])
+selected_mall_name = st.sidebar.selectbox("Select Shopping Centre", list(mall_map))
 selected_mall_id = mall_map[selected_mall_name]
 
 # Filter Data
 top_n = st.sidebar.slider("Show Top Opportunities", 5, 200, 50)
-mall_data = df[df['Mall_ID'] == selected_mall_id].copy()
-mall_data = mall_data.sort_values('Revenue_Uplift', ascending=False).head(top_n)
+mall_data = get_mall_slice(selected_mall_id, top_n, facts_mtime)
 
 # --- Top Level KPIs ---
 # Assuming 150 m2 avg store size for impact calc if not in data. 
 # We have Density (€/m2). Let's show Density Uplift and Total Potential assuming avg store size of 200m2 for estimation.
 avg_store_size = 200 
-total_opportunity = mall_data['Revenue_Uplift'].sum() * avg_store_size 
-avg_uplift = mall_data['Revenue_Uplift'].mean()
+uplift_cumsum, uplift_count = load_uplift_cumsums(facts_mtime)[selected_mall_id]
+n_stores = min(top_n, len(uplift_cumsum))
+total_uplift = uplift_cumsum[n_stores - 1]
+total_opportunity = total_uplift * avg_store_size
+avg_uplift = total_uplift / uplift_count[n_stores - 1] if uplift_count[n_stores - 1] else float('nan')
 
 kpi1, kpi2, kpi3 = st.columns(3)
-kpi1.metric("Identified Opportunities", f"{len(mall_data)} Stores", "Underperforming Assets")
+kpi1.metric("Identified Opportunities", f"{n_stores} Stores", "Underperforming Assets")
 kpi2.metric("Avg. Density Uplift", f"+€{avg_uplift:,.0f} /m²", "Per Optimized Unit")
 kpi3.metric("Total Est. Revenue Unlock", f"€{total_opportunity/1000000:.1f}M", "Annual Potential (est. @ 200m² avg)")
 
@@ -98,17 +236,53 @@ st.subheader(f"Optimization Targets: {selected_mall_name}")
 
 # Display Table
 st.dataframe(
-    mall_data[['Store_Code', 'Current_SubCat', 'Rec_SubCat', 'Current_Sales_Density', 'Rec_Projected_Sales', 'Revenue_Uplift']],
+    get_mall_table(selected_mall_id, top_n, facts_mtime),
     column_config={
-        "Current_Sales_Density": st.column_config.NumberColumn("Current Sales (€/m²)", format="€%.0f"),
-        "Rec_Projected_Sales": st.column_config.NumberColumn("Potential Sales (€/m²)", format="€%.0f"),
-        "Revenue_Uplift": st.column_config.NumberColumn("Uplift (€/m²)", format="€%.0f"),
+        "Current_Sales_Density": st.column_config.NumberColumn("Current Sales (€/m²)", format="€%d"),
+        "Rec_Projected_Sales": st.column_config.NumberColumn("Potential Sales (€/m²)", format="€%d"),
+        "Revenue_Uplift": st.column_config.NumberColumn("Uplift (€/m²)", format="€%d"),
     },
     use_container_width=True,
     hide_index=True
 )
 
 # --- Deep Dive Section ---
+# Vega-Lite spec for the scenario bar chart, with text labels on the bars.
+# Structurally static: only the data and the title change per store.
+SCENARIO_CHART_SPEC = {
+    "$schema": "https://vega.github.io/schema/vega-lite/v5.json",
+    "height": 350,
+    "encoding": {
+        "x": {"field": "Scenario", "type": "nominal", "sort": None, "axis": {"labelAngle": 0}},
+        "y": {"field": "Sales Density (€)", "type": "quantitative", "axis": {"format": "€s"}},
+        "color": {"field": "Color", "type": "nominal", "scale": None, "legend": None},
+        "tooltip": [
+            {"field": "Scenario", "type": "nominal"},
+            {"field": "Sales Density (€)", "type": "quantitative"}
+        ]
+    },
+    "layer": [
+        {"mark": {"type": "bar"}},
+        {
+            "mark": {"type": "text", "align": "center", "baseline": "bottom", "dy": -5, "fontWeight": "bold"},
+            "encoding": {"text": {"field": "Sales Density (€)", "type": "quantitative", "format": "€,.0f"}}
+        }
+    ]
+}
+
+@st.cache_data(max_entries=256)
+def build_chart_spec(current, potential, projected, store_code):
+    chart_data = [
+        {'Scenario': 'Current Performance', 'Sales Density (€)': current, 'Color': '#FF4B4B'}, # Red
+        {'Scenario': 'Location Potential (Fair Value)', 'Sales Density (€)': potential, 'Color': '#808080'}, # Grey
+        {'Scenario': 'Optimized Tenant (AI)', 'Sales Density (€)': projected, 'Color': '#2ECC71'} # Green
+    ]
+    return {
+        **SCENARIO_CHART_SPEC,
+        "data": {"values": chart_data},
+        "title": f"Optimization Analysis: Store {store_code}"
+    }
+
 st.markdown("---")
 st.subheader("💡 Scenario Simulator")
 
@@ -117,55 +291,31 @@ if not mall_data.empty:
 
     with col_left:
         target_store = st.selectbox("Select a Store to Analyze:", mall_data['Store_Code'])
-        store_row = mall_data[mall_data['Store_Code'] == target_store].iloc[0]
+        store_row = get_store_rows(selected_mall_id, top_n, facts_mtime)[target_store]
         
         st.info(f"**Current Tenant:** {store_row['Current_SubCat']}")
         st.success(f"**AI Recommendation:** {store_row['Rec_SubCat']}")
         st.write(f"The model detects this location has structural/network characteristics usage suitable for **{store_row['Rec_Category']}** (specifically **{store_row['Rec_SubCat']}**).")
-        st.metric("Projected Density Increase", f"+€{store_row['Revenue_Uplift']:,.0f}")
+        st.metric("Projected Density Increase", store_row['Revenue_Uplift_fmt'])
         
         with st.expander("🔄 See Alternative Strategies"):
-             if 'Rec_2_SubCat' in store_row and pd.notna(store_row['Rec_2_SubCat']):
+             if pd.notna(store_row['Rec_2_SubCat']):
                  st.write("**Top 3 AI Recommendations:**")
-                 st.markdown(f"1. 🥇 **{store_row['Rec_SubCat']}** (+€{store_row['Revenue_Uplift']:,.0f})")
-                 st.markdown(f"2. 🥈 **{store_row.get('Rec_2_SubCat')}** (+€{store_row.get('Rec_2_Uplift', 0):,.0f})")
-                 st.markdown(f"3. 🥉 **{store_row.get('Rec_3_SubCat')}** (+€{store_row.get('Rec_3_Uplift', 0):,.0f})")
+                 st.markdown(f"1. 🥇 **{store_row['Rec_SubCat']}** ({store_row['Revenue_Uplift_fmt']})")
+                 st.markdown(f"2. 🥈 **{store_row['Rec_2_SubCat']}** ({store_row['Rec_2_Uplift_fmt']})")
+                 st.markdown(f"3. 🥉 **{store_row['Rec_3_SubCat']}** ({store_row['Rec_3_Uplift_fmt']})")
              else:
                  st.write("No alternative strategies available.")
 
     with col_right:
         # Bar Chart
-        chart_data = pd.DataFrame({
-            'Scenario': ['Current Performance', 'Location Potential (Fair Value)', 'Optimized Tenant (AI)'],
-            'Sales Density (€)': [
-                store_row['Current_Sales_Density'], 
-                store_row['Model_Location_Potential'], 
-                store_row['Rec_Projected_Sales']
-            ],
-            'Color': ['#FF4B4B', '#808080', '#2ECC71'] # Red, Grey, Green
-        })
-        
-        c = alt.Chart(chart_data).mark_bar().encode(
-            x=alt.X('Scenario', sort=None, axis=alt.Axis(labelAngle=0)),
-            y=alt.Y('Sales Density (€)', axis=alt.Axis(format='€s')),
-            color=alt.Color('Color', scale=None, legend=None),
-            tooltip=['Scenario', 'Sales Density (€)']
-        ).properties(
-            title=f"Optimization Analysis: Store {store_row['Store_Code']}",
-            height=350
-        )
-        
-        # Add text labels on bars
-        text = c.mark_text(
-            align='center',
-            baseline='bottom',
-            dy=-5,
-            fontWeight='bold'
-        ).encode(
-            text=alt.Text('Sales Density (€)', format='€,.0f')
+        spec = build_chart_spec(
+            float(store_row['Current_Sales_Density']),
+            float(store_row['Model_Location_Potential']),
+            float(store_row['Rec_Projected_Sales']),
+            str(store_row['Store_Code'])
         )
-        
-        st.altair_chart(c + text, use_container_width=True)
+        st.vega_lite_chart(spec=spec, use_container_width=True)
 else:
     st.warning("No opportunities found for this mall with the current filter settings.")
 